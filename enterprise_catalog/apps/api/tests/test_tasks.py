@@ -438,11 +438,11 @@ class UpdateFullContentMetadataTaskTests(TestCase):
         non_course_key = 'course-runX'
 
         # Mock out the data that should be returned from discovery's /api/v1/courses and /api/v1/programs endpoints
-        mock_oauth_client.return_value.get.return_value.json.side_effect = [
+        mock_oauth_client.return_value.get.side_effect = [
             # first call will be /api/v1/courses
-            {'results': [course_data_1, course_data_2, course_data_3]},
+            mock.Mock(headers={}, content=json.dumps({'results': [course_data_1, course_data_2, course_data_3]})),
             # second call will be to /api/v1/programs
-            {'results': [program_data]},
+            mock.Mock(headers={}, content=json.dumps({'results': [program_data]})),
         ]
         mock_partition_course_keys.return_value = ([], [],)
 
@@ -500,9 +500,10 @@ class UpdateFullContentMetadataTaskTests(TestCase):
         program_data_2 = {'uuid': program_key_2, 'full_program_only_field': 'test_2'}
 
         # Mock out the data that should be returned from discovery's /api/v1/programs endpoint
-        mock_oauth_client.return_value.get.return_value.json.return_value = {
+        mock_oauth_client.return_value.get.return_value.headers = {}
+        mock_oauth_client.return_value.get.return_value.content = json.dumps({
             'results': [program_data_1, program_data_2],
-        }
+        })
         mock_partition_program_keys.return_value = ([], [],)
 
         metadata_1 = ContentMetadataFactory(content_type=PROGRAM, content_key=program_key_1)
@@ -578,9 +579,8 @@ class UpdateFullContentMetadataTaskTests(TestCase):
         }
 
         # Mock out the data that should be returned from discovery's /api/v1/courses endpoint
-        mock_oauth_client.return_value.get.return_value.json.side_effect = [
-            {'results': [course_data]}
-        ]
+        mock_oauth_client.return_value.get.return_value.headers = {}
+        mock_oauth_client.return_value.get.return_value.content = json.dumps({'results': [course_data]})
         mock_partition_course_keys.return_value = ([], [],)
 
         # Simulate a pre-existing ContentMetadata object freshly seeded using the response from /api/v1/search/all/
@@ -12,6 +12,8 @@ DISCOVERY_COURSES_ENDPOINT = urljoin(settings.DISCOVERY_SERVICE_API_URL, 'course
 DISCOVERY_PROGRAMS_ENDPOINT = urljoin(settings.DISCOVERY_SERVICE_API_URL, 'programs/')
 DISCOVERY_OFFSET_SIZE = 200
 DISCOVERY_CATALOG_QUERY_CACHE_KEY_TPL = 'catalog_query:{id}'
+DISCOVERY_SEARCH_ALL_CACHE_KEY_TPL = 'discovery:search_all:{content_filter_hash}'
+DISCOVERY_CONDITIONAL_GET_CACHE_KEY_TPL = 'discovery:conditional_get:{request_hash}'
 
 # Enterprise API Client Constants
 ENTERPRISE_API_URL = urljoin(settings.LMS_BASE_URL, '/enterprise/api/v1/')
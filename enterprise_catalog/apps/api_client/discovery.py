@@ -2,52 +2,198 @@
 Discovery service api client code.
 """
 import logging
+import math
+import random
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import islice
 
+import orjson
 import requests
 from celery.exceptions import SoftTimeLimitExceeded
 from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+
+from enterprise_catalog.apps.catalog.utils import get_content_filter_hash
 
 from .base_oauth import BaseOAuthClient
 from .constants import (
+    DISCOVERY_CONDITIONAL_GET_CACHE_KEY_TPL,
     DISCOVERY_COURSES_ENDPOINT,
     DISCOVERY_OFFSET_SIZE,
     DISCOVERY_PROGRAMS_ENDPOINT,
+    DISCOVERY_SEARCH_ALL_CACHE_KEY_TPL,
     DISCOVERY_SEARCH_ALL_ENDPOINT,
 )
 
 
 LOGGER = logging.getLogger(__name__)
 
+# DiscoveryApiClient shared by CatalogQueryMetadata lookups, see _get_client()
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _decode_json(response):
+    """
+    Decodes the JSON body of a discovery response with orjson, which is several times faster
+    than the stdlib decoder on large payloads. Invalid bodies raise the same
+    requests.exceptions.JSONDecodeError that response.json() would, without parsing them twice.
+    """
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError as exc:
+        raise requests.exceptions.JSONDecodeError(exc.msg, exc.doc, exc.pos) from exc
+
+
+def _set_cache(cache_key, value, timeout):
+    """
+    Caches value under cache_key, logging rather than raising if the cache backend rejects it,
+    e.g. because it's larger than memcached's maximum item size. Failing to cache data that was
+    already retrieved shouldn't fail the retrieval.
+    """
+    try:
+        cache.set(cache_key, value, timeout)
+    except Exception as exc:  # pylint: disable=broad-except
+        LOGGER.warning('Could not cache course-discovery data under %s: %s', cache_key, exc)
+
 
 class DiscoveryApiClient(BaseOAuthClient):
     """
     Object builds an API client to make calls to the Discovery Service.
     """
 
-    # the maximum number of retries to attempt a call
-    MAX_RETRIES = getattr(settings, "ENTERPRISE_DISCOVERY_CLIENT_MAX_RETRIES", 4)
-    # the number of seconds to sleep beteween tries, which is doubled every attempt
-    BACKOFF_FACTOR = getattr(settings, "ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_FACTOR", 2)
-    # the number of seconds to wait for a response
-    HTTP_TIMEOUT = getattr(settings, "ENTERPRISE_DISCOVERY_CLIENT_TIMEOUT", 15)
+    # the 4xx status codes worth retrying, along with any 5xx; other 4xx responses will never succeed
+    RETRYABLE_CLIENT_ERROR_STATUS_CODES = (408, 425, 429)
+
+    def __init__(self):
+        super().__init__()
+        # The session already keeps pooled keep-alive connections, but only DEFAULT_POOLSIZE of
+        # them per host; make sure there's one for each thread fetching pages concurrently.
+        adapter = HTTPAdapter(pool_maxsize=max(DEFAULT_POOLSIZE, self.MAX_WORKERS))
+        self.client.mount('http://', adapter)
+        self.client.mount('https://', adapter)
+
+    @classmethod
+    def _cfg(cls, name, default):
+        """
+        Return the value of the named Django setting, or default if it isn't set
+        """
+        return getattr(settings, name, default)
+
+    # The settings below are read on every access rather than once, so that overridden or reloaded
+    # settings also apply to the long-lived client shared by CatalogQueryMetadata.
+
+    @property
+    def MAX_RETRIES(self):
+        """
+        The maximum number of retries to attempt a call
+        """
+        return self._cfg("ENTERPRISE_DISCOVERY_CLIENT_MAX_RETRIES", 4)
+
+    @property
+    def BACKOFF_FACTOR(self):
+        """
+        The number of seconds to sleep beteween tries, which is doubled every attempt
+        """
+        return self._cfg("ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_FACTOR", 2)
+
+    @property
+    def HTTP_TIMEOUT(self):
+        """
+        The number of seconds to wait for a response
+        """
+        return self._cfg("ENTERPRISE_DISCOVERY_CLIENT_TIMEOUT", 15)
+
+    @property
+    def MAX_BACKOFF_SECONDS(self):
+        """
+        The maximum number of seconds to sleep between tries, regardless of the attempt count
+        """
+        return self._cfg("ENTERPRISE_DISCOVERY_CLIENT_MAX_BACKOFF", 60)
+
+    @property
+    def JITTER(self):
+        """
+        The maximum fraction of the backoff taken off as random jitter, so that concurrent
+        workers failing at the same time don't all retry in lockstep
+        """
+        return self._cfg("ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_JITTER", 0.5)
+
+    @property
+    def MAX_WORKERS(self):
+        """
+        The maximum number of pages to fetch concurrently when traversing paginated results
+        """
+        return self._cfg("ENTERPRISE_DISCOVERY_CLIENT_MAX_WORKERS", 8)
 
     def _calculate_backoff(self, attempt_count):
         """
-        Calculate the seconds to sleep based on attempt_count
+        Calculate the seconds to sleep based on attempt_count, with random jitter applied.
+        The result never exceeds MAX_BACKOFF_SECONDS, so that raising MAX_RETRIES can't
+        hold a worker (and its soft time limit budget) hostage for minutes at a time. The
+        backoff is capped before the jitter is applied, so capped attempts stay spread out.
+
+        attempt_count is the number of attempts made so far, and must be at least 1.
+        """
+        backoff = self.BACKOFF_FACTOR * (1 << (attempt_count - 1))
+        capped_backoff = min(self.MAX_BACKOFF_SECONDS, backoff)
+        return capped_backoff * random.uniform(1 - self.JITTER, 1)
+
+    def _is_retryable_status(self, status_code):
+        """
+        Return whether a response with the given error status_code may succeed if retried
+        """
+        return status_code >= 500 or status_code in self.RETRYABLE_CLIENT_ERROR_STATUS_CODES
+
+    def _retrieve_pages_concurrently(self, retrieve_page, pages):
         """
-        return (self.BACKOFF_FACTOR * (2 ** (attempt_count - 1)))
+        Yields a (page, future) pair for each of the given pages, in order, where the future holds
+        the result of calling retrieve_page(page, stop_event) on a pool of MAX_WORKERS threads.
+
+        Only MAX_WORKERS pages are fetched ahead of the one the caller is consuming, and a page is
+        no longer referenced here once it has been yielded, so a slow caller doesn't end up holding
+        every remaining page in memory.
 
-    def _retrieve_metadata_for_content_filter(self, content_filter, page, request_params):
+        Once the caller stops consuming results, e.g. because a page failed or the task hit its
+        soft time limit, queued pages are cancelled and stop_event is set. Pages already running
+        are not interrupted: their in-flight request runs until it completes or HTTP_TIMEOUT
+        expires, but retrieve_page should check stop_event rather than backing-off and retrying.
+        """
+        stop_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+        pages = iter(pages)
+        pending = deque(
+            (page, executor.submit(retrieve_page, page, stop_event))
+            for page in islice(pages, self.MAX_WORKERS)
+        )
+        try:
+            while pending:
+                page, future = pending.popleft()
+                # Keep every worker busy while the caller waits on this page
+                for next_page in islice(pages, 1):
+                    pending.append((next_page, executor.submit(retrieve_page, next_page, stop_event)))
+                yield page, future
+        finally:
+            stop_event.set()
+            for _, pending_future in pending:
+                pending_future.cancel()
+            executor.shutdown(wait=False)
+
+    def _retrieve_metadata_for_content_filter(self, content_filter, page, request_params, stop_event=None):
         """
         Makes a request to discovery's /search/all/ endpoint with the specified
-        content_filter, page, and request_params
+        content_filter, page, and request_params. Failed requests are retried, unless
+        the optional stop_event is set while backing-off.
         """
-        LOGGER.info(f'Retrieving results from course-discovery for page {page}...')
+        LOGGER.debug('Retrieving results from course-discovery for page %s...', page)
         attempts = 0
         while True:
             attempts = attempts + 1
-            successful = True
             exception = None
             try:
                 response = self.client.post(
@@ -57,38 +203,58 @@ class DiscoveryApiClient(BaseOAuthClient):
                     timeout=self.HTTP_TIMEOUT,
                 )
                 successful = response.status_code < 400
-                elapsed_seconds = response.elapsed.total_seconds()
-                LOGGER.info(
-                    f'Retrieved results from course-discovery for page {page} in '
-                    f'retrieve_metadata_for_content_filter_seconds={elapsed_seconds} seconds.'
-                )
+                if LOGGER.isEnabledFor(logging.DEBUG):
+                    elapsed_seconds = response.elapsed.total_seconds()
+                    LOGGER.debug(
+                        f'Retrieved results from course-discovery for page {page} in '
+                        f'retrieve_metadata_for_content_filter_seconds={elapsed_seconds} seconds.'
+                    )
+                if successful:
+                    # Decode here so a truncated or otherwise undecodable body is retried like any other
+                    # failed request, and error bodies are never decoded at all.
+                    data = _decode_json(response)
             except requests.exceptions.RequestException as err:
                 exception = err
                 LOGGER.exception(f'Error while retrieving results from course-discovery for page {page}')
                 successful = False
-            if attempts <= self.MAX_RETRIES and not successful:
-                sleep_seconds = self._calculate_backoff(attempts)
-                LOGGER.warning(
-                    f'failed request detected from {DISCOVERY_SEARCH_ALL_ENDPOINT}, '
-                    'backing-off before retrying, '
-                    f'sleeping {sleep_seconds} seconds...'
+            if successful:
+                break
+            retryable = exception is not None or self._is_retryable_status(response.status_code)
+            if exception is None:
+                exception = requests.exceptions.HTTPError(
+                    f'{response.status_code} error response from {DISCOVERY_SEARCH_ALL_ENDPOINT}',
+                    response=response,
                 )
+            if attempts > self.MAX_RETRIES or not retryable:
+                # Retries are exhausted or can't help, so raise right away rather than backing-off again
+                LOGGER.error(
+                    f'Giving up on retrieving results from course-discovery for page {page} '
+                    f'after {attempts} attempts'
+                )
+                raise exception
+            sleep_seconds = self._calculate_backoff(attempts)
+            LOGGER.warning(
+                f'failed request detected from {DISCOVERY_SEARCH_ALL_ENDPOINT}, '
+                'backing-off before retrying, '
+                f'sleeping {sleep_seconds} seconds...'
+            )
+            if stop_event is None:
                 time.sleep(sleep_seconds)
-            else:
-                if exception:
-                    raise exception
-                break
-        return response.json()
+            elif stop_event.wait(sleep_seconds):
+                # Nobody is waiting on this page anymore, so don't bother retrying it
+                raise exception
+        return data
 
-    def get_metadata_by_query(self, catalog_query):
+    def iter_metadata_by_query(self, catalog_query):
         """
-        Return results from the discovery service's search/all endpoint.
+        Yield results from the discovery service's search/all endpoint, page by page, so callers
+        can start processing the first page while later pages are still being retrieved.
 
         Arguments:
             catalog_query (CatalogQuery): Catalog Query object to retrieve metadata for
 
-        Returns:
-            list: a list of the results, or None if there was an error calling the discovery service.
+        Yields:
+            dict: each of the results, in page order.
         """
         request_params = {
             # Omit non-active course runs from the course-discovery results
@@ -101,18 +267,58 @@ class DiscoveryApiClient(BaseOAuthClient):
             'include_learner_pathways': True,
         }
 
+        start_time = time.perf_counter()
         page = 1
-        results = []
+        pages_count = 0
+        results_count = 0
         try:
             content_filter = catalog_query.content_filter
             response = self._retrieve_metadata_for_content_filter(content_filter, page, request_params)
-            results += response.get('results', [])
-            # Traverse all pages and concatenate results
+            pages_count += 1
+            page_results = response.get('results') or ()
+            results_count += len(page_results)
+            yield from page_results
+            if response.get('next') and response.get('count'):
+                # The total count tells us every remaining page up front, so fetch them concurrently
+                pages = range(2, math.ceil(response['count'] / request_params['page_size']) + 1)
+                futures = self._retrieve_pages_concurrently(
+                    lambda next_page, stop_event: self._retrieve_metadata_for_content_filter(
+                        content_filter, next_page, {**request_params, 'page': next_page}, stop_event,
+                    ),
+                    pages,
+                )
+                with closing(futures):
+                    for page, future in futures:
+                        try:
+                            response = future.result()
+                        except requests.exceptions.HTTPError as exc:
+                            if exc.response is None or exc.response.status_code != 404:
+                                raise
+                            # Content was removed since the first page was counted, so this page and
+                            # any after it are past the end of the results.
+                            LOGGER.info(
+                                'Page %s from course-discovery no longer exists for catalog query %s, '
+                                'treating it as the end of the results.',
+                                page,
+                                catalog_query,
+                            )
+                            # The last page retrieved may still link to this one, so there's nothing to follow
+                            response = {}
+                            break
+                        pages_count += 1
+                        page_results = response.get('results') or ()
+                        results_count += len(page_results)
+                        yield from page_results
+            # Traverse any remaining pages and yield their results, including pages
+            # for content that was added since the first page was counted
             while response.get('next'):
-                page += 1
-                request_params.update({'page': page})
+                page = pages_count + 1
+                request_params['page'] = page
                 response = self._retrieve_metadata_for_content_filter(content_filter, page, request_params)
-                results += response.get('results', [])
+                pages_count += 1
+                page_results = response.get('results') or ()
+                results_count += len(page_results)
+                yield from page_results
         except Exception as exc:
             LOGGER.exception(
                 'Could not retrieve content items from course-discovery (page %s) for catalog query %s: %s',
@@ -122,19 +328,69 @@ class DiscoveryApiClient(BaseOAuthClient):
             )
             raise exc
 
-        return results
+        LOGGER.info(
+            f'Retrieved {results_count} results in {pages_count} pages from course-discovery for catalog query '
+            f'{catalog_query} in iter_metadata_by_query_seconds={time.perf_counter() - start_time} seconds.'
+        )
 
-    def _retrieve_courses(self, offset, request_params):
+    def get_metadata_by_query(self, catalog_query):
         """
-        Makes a request to discovery's /api/v1/courses/ endpoint with the specified offset and request_params
+        Return results from the discovery service's search/all endpoint.
+
+        Arguments:
+            catalog_query (CatalogQuery): Catalog Query object to retrieve metadata for
+
+        Returns:
+            list: a list of the results.
+        """
+        return list(self.iter_metadata_by_query(catalog_query))
+
+    def _conditional_get(self, url, request_params):
+        """
+        Makes a GET request to the specified discovery url with the specified request_params.
+
+        If an earlier response to the same request carried an ETag or Last-Modified header, it is
+        revalidated with If-None-Match/If-Modified-Since, and the cached JSON is returned when discovery
+        answers 304 Not Modified rather than transferring and decoding the unchanged page again.
         """
-        LOGGER.info('Retrieving courses from course-discovery for offset %s...', offset)
+        request_hash = get_content_filter_hash([url, request_params])
+        cache_key = DISCOVERY_CONDITIONAL_GET_CACHE_KEY_TPL.format(request_hash=request_hash)
+        cached_response = cache.get(cache_key)
+
+        headers = {}
+        if cached_response:
+            if cached_response['etag']:
+                headers['If-None-Match'] = cached_response['etag']
+            if cached_response['last_modified']:
+                headers['If-Modified-Since'] = cached_response['last_modified']
+
         response = self.client.get(
-            DISCOVERY_COURSES_ENDPOINT,
+            url,
             params=request_params,
+            headers=headers,
             timeout=self.HTTP_TIMEOUT,
-        ).json()
-        return response
+        )
+        if cached_response and response.status_code == 304:
+            LOGGER.debug('Course-discovery returned 304 Not Modified for %s, using the cached response.', url)
+            return cached_response['data']
+
+        data = _decode_json(response)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            _set_cache(
+                cache_key,
+                {'etag': etag, 'last_modified': last_modified, 'data': data},
+                settings.DISCOVERY_COURSE_DATA_CACHE_TIMEOUT,
+            )
+        return data
+
+    def _retrieve_courses(self, offset, request_params):
+        """
+        Makes a request to discovery's /api/v1/courses/ endpoint with the specified offset and request_params
+        """
+        LOGGER.debug('Retrieving courses from course-discovery for offset %s...', offset)
+        return self._conditional_get(DISCOVERY_COURSES_ENDPOINT, request_params)
 
     def get_courses(self, query_params=None):
         """
@@ -157,13 +413,27 @@ class DiscoveryApiClient(BaseOAuthClient):
         offset = 0
         try:
             response = self._retrieve_courses(offset, request_params)
-            courses += response.get('results')
-            # Traverse all pages and concatenate results
+            courses.extend(response.get('results') or ())
+            if response.get('next') and response.get('count'):
+                # The total count tells us every remaining offset up front, so fetch them concurrently
+                offsets = range(DISCOVERY_OFFSET_SIZE, response['count'], DISCOVERY_OFFSET_SIZE)
+                futures = self._retrieve_pages_concurrently(
+                    lambda next_offset, stop_event: self._retrieve_courses(
+                        next_offset, {**request_params, 'offset': next_offset},
+                    ),
+                    offsets,
+                )
+                with closing(futures):
+                    for offset, future in futures:
+                        response = future.result()
+                        courses.extend(response.get('results') or ())
+            # Traverse any remaining pages and concatenate results, including pages
+            # for content that was added since the first page was counted
             while response.get('next'):
                 offset += DISCOVERY_OFFSET_SIZE
-                request_params.update({'offset': offset})
+                request_params['offset'] = offset
                 response = self._retrieve_courses(offset, request_params)
-                courses += response.get('results', [])
+                courses.extend(response.get('results') or ())
         except SoftTimeLimitExceeded as exc:
             LOGGER.warning(
                 'A task reached the soft time limit while traversing courses. %d courses already retrieved'
@@ -185,13 +455,8 @@ class DiscoveryApiClient(BaseOAuthClient):
         """
         Makes a request to discovery's /api/v1/programs/ endpoint with the specified offset and request_params
         """
-        LOGGER.info('Retrieving programs from course-discovery for offset %s...', offset)
-        response = self.client.get(
-            DISCOVERY_PROGRAMS_ENDPOINT,
-            params=request_params,
-            timeout=self.HTTP_TIMEOUT,
-        ).json()
-        return response
+        LOGGER.debug('Retrieving programs from course-discovery for offset %s...', offset)
+        return self._conditional_get(DISCOVERY_PROGRAMS_ENDPOINT, request_params)
 
     def get_programs(self, query_params=None):
         """
@@ -215,13 +480,27 @@ class DiscoveryApiClient(BaseOAuthClient):
         offset = 0
         try:
             response = self._retrieve_programs(offset, request_params)
-            programs += response.get('results')
-            # Traverse all pages and concatenate results
+            programs.extend(response.get('results') or ())
+            if response.get('next') and response.get('count'):
+                # The total count tells us every remaining offset up front, so fetch them concurrently
+                offsets = range(DISCOVERY_OFFSET_SIZE, response['count'], DISCOVERY_OFFSET_SIZE)
+                futures = self._retrieve_pages_concurrently(
+                    lambda next_offset, stop_event: self._retrieve_programs(
+                        next_offset, {**request_params, 'offset': next_offset},
+                    ),
+                    offsets,
+                )
+                with closing(futures):
+                    for offset, future in futures:
+                        response = future.result()
+                        programs.extend(response.get('results') or ())
+            # Traverse any remaining pages and concatenate results, including pages
+            # for content that was added since the first page was counted
             while response.get('next'):
                 offset += DISCOVERY_OFFSET_SIZE
-                request_params.update({'offset': offset})
+                request_params['offset'] = offset
                 response = self._retrieve_programs(offset, request_params)
-                programs += response.get('results', [])
+                programs.extend(response.get('results') or ())
         except SoftTimeLimitExceeded as exc:
             LOGGER.warning(
                 'A task reached the soft time limit while traversing programs. %d programs already retrieved'
@@ -240,10 +519,42 @@ class DiscoveryApiClient(BaseOAuthClient):
         return programs
 
 
+def _get_client():
+    """
+    Returns a DiscoveryApiClient shared across the process, so that its pool of keep-alive
+    connections is reused from one catalog query to the next. The underlying OAuthAPIClient
+    checks its access token before every request, so the shared client never goes stale.
+    """
+    global _CLIENT  # pylint: disable=global-statement
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = DiscoveryApiClient()
+    return _CLIENT
+
+
+def _get_catalog_query_metadata_cache_key(catalog_query):
+    """
+    Returns the cache key for the discovery /search/all/ results of the given catalog_query.
+    Catalog queries with identical content filters share the same key.
+    """
+    content_filter_hash = get_content_filter_hash(catalog_query.content_filter)
+    return DISCOVERY_SEARCH_ALL_CACHE_KEY_TPL.format(content_filter_hash=content_filter_hash)
+
+
+def clear_catalog_query_metadata_cache(catalog_query):
+    """
+    Removes any cached discovery /search/all/ results for the given catalog_query,
+    so that the next CatalogQueryMetadata lookup fetches fresh data from discovery.
+    """
+    cache.delete(_get_catalog_query_metadata_cache_key(catalog_query))
+
+
 class CatalogQueryMetadata:
     """
     Metadata for a given CatalogQuery from the Discovery API.
 
+    Data is cached for 'settings.DISCOVERY_CATALOG_QUERY_CACHE_TIMEOUT' seconds.
     """
     def __init__(self, catalog_query):
         """
@@ -265,8 +576,8 @@ class CatalogQueryMetadata:
 
     def _get_catalog_query_metadata(self, catalog_query):
         """
-        Retrieve JSON data containing Catalog Query metadata for the given catalog_query_id
-        by making a call to Discovery API Client.
+        Retrieve JSON data containing Catalog Query metadata for the given catalog_query_id.
+        Look in cache first, make call to Discovery API Client if not found.
 
         Arguments:
             catalog_query (CatalogQuery): Catalog Query object
@@ -275,6 +586,12 @@ class CatalogQueryMetadata:
             customer_data (dict): Enterprise Customer details OR
                 Empty dictionary if no data found from API.
         """
-        client = DiscoveryApiClient()
-        catalog_query_data = client.get_metadata_by_query(catalog_query)
+        cache_key = _get_catalog_query_metadata_cache_key(catalog_query)
+        catalog_query_data = cache.get(cache_key)
+
+        if catalog_query_data is None:
+            client = _get_client()
+            catalog_query_data = client.get_metadata_by_query(catalog_query)
+            _set_cache(cache_key, catalog_query_data, settings.DISCOVERY_CATALOG_QUERY_CACHE_TIMEOUT)
+
         return catalog_query_data
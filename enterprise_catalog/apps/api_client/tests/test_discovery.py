@@ -1,18 +1,54 @@
 """ Tests for discovery api client. """
+import json
+import threading
+from contextlib import closing
 from unittest import mock
 
+import ddt
 import requests
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from simplejson import JSONDecodeError
 
 from enterprise_catalog.apps.catalog.tests.factories import CatalogQueryFactory
 
-from ..discovery import DiscoveryApiClient
+from ..constants import DISCOVERY_OFFSET_SIZE
+from ..discovery import (
+    CatalogQueryMetadata,
+    DiscoveryApiClient,
+    clear_catalog_query_metadata_cache,
+)
 
 
+@ddt.ddt
 class TestDiscoveryApiClient(TestCase):
     """ DiscoveryApiClient tests. """
 
+    @override_settings(ENTERPRISE_DISCOVERY_CLIENT_MAX_WORKERS=32)
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_client_pool_fits_max_workers(self, mock_oauth_client):
+        """
+        The underlying session's connection pools should have room for every concurrent page fetch.
+        """
+        DiscoveryApiClient()
+
+        mounted = dict(call.args for call in mock_oauth_client.return_value.mount.call_args_list)
+        self.assertEqual(set(mounted), {'http://', 'https://'})
+        adapter = mounted['https://']
+        self.assertIsInstance(adapter, requests.adapters.HTTPAdapter)
+        self.assertEqual(adapter._pool_maxsize, 32)  # pylint: disable=protected-access
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_client_reads_current_settings(self, mock_oauth_client):  # pylint: disable=unused-argument
+        """
+        An existing client should pick up settings overridden after it was created.
+        """
+        client = DiscoveryApiClient()
+
+        with override_settings(ENTERPRISE_DISCOVERY_CLIENT_MAX_RETRIES=10, ENTERPRISE_DISCOVERY_CLIENT_TIMEOUT=30):
+            assert client.MAX_RETRIES == 10
+            assert client.HTTP_TIMEOUT == 30
+
     @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
     def test_get_metadata_by_query_with_results(self, mock_oauth_client):
         """
@@ -20,9 +56,7 @@ class TestDiscoveryApiClient(TestCase):
         traverse_pagination if traverse_pagination is false.
         """
         mock_oauth_client.return_value.post.return_value.status_code = 200
-        mock_oauth_client.return_value.post.return_value.json.return_value = {
-            'results': [{'key': 'fakeX'}],
-        }
+        mock_oauth_client.return_value.post.return_value.content = b'{"results": [{"key": "fakeX"}]}'
 
         catalog_query = CatalogQueryFactory()
         client = DiscoveryApiClient()
@@ -33,6 +67,184 @@ class TestDiscoveryApiClient(TestCase):
         expected_response = [{'key': 'fakeX'}]
         self.assertEqual(actual_response, expected_response)
 
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_metadata_by_query_decodes_content(self, mock_oauth_client):
+        """
+        get_metadata_by_query should decode the raw response content without calling response.json().
+        """
+        mock_oauth_client.return_value.post.return_value.status_code = 200
+        mock_oauth_client.return_value.post.return_value.content = b'{"results": [{"key": "fakeX"}]}'
+
+        catalog_query = CatalogQueryFactory()
+        client = DiscoveryApiClient()
+        self.assertEqual(client.get_metadata_by_query(catalog_query), [{'key': 'fakeX'}])
+        mock_oauth_client.return_value.post.return_value.json.assert_not_called()
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_metadata_by_query_with_null_results(self, mock_oauth_client):
+        """
+        get_metadata_by_query should treat a null results list as an empty page.
+        """
+        mock_oauth_client.return_value.post.return_value.status_code = 200
+        mock_oauth_client.return_value.post.return_value.content = b'{"results": null}'
+
+        catalog_query = CatalogQueryFactory()
+        client = DiscoveryApiClient()
+        self.assertEqual(client.get_metadata_by_query(catalog_query), [])
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_metadata_by_query_with_multiple_pages(self, mock_oauth_client):
+        """
+        get_metadata_by_query should fetch the remaining pages based on the total count,
+        and return the results in page order.
+        """
+        def mock_post(*args, **kwargs):
+            page = kwargs['params'].get('page', 1)
+            return mock.Mock(status_code=200, content=json.dumps({
+                'count': 250,
+                'next': 'next-page' if page < 3 else None,
+                'results': [{'key': f'fakeX-{page}'}],
+            }).encode())
+        mock_oauth_client.return_value.post.side_effect = mock_post
+
+        catalog_query = CatalogQueryFactory()
+        client = DiscoveryApiClient()
+        with self.assertLogs('enterprise_catalog.apps.api_client.discovery', level='INFO') as logs:
+            actual_response = client.get_metadata_by_query(catalog_query)
+
+        assert mock_oauth_client.return_value.post.call_count == 3
+        expected_response = [{'key': 'fakeX-1'}, {'key': 'fakeX-2'}, {'key': 'fakeX-3'}]
+        self.assertEqual(actual_response, expected_response)
+        # a single summary line is logged at INFO for the whole query
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Retrieved 3 results in 3 pages', logs.output[0])
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_iter_metadata_by_query_is_lazy(self, mock_oauth_client):
+        """
+        iter_metadata_by_query should yield the first page's results before requesting the next page.
+        """
+        first_page = mock.Mock(status_code=200, content=b'{"next": "next-page", "results": [{"key": "fakeX-1"}]}')
+        second_page = mock.Mock(status_code=200, content=b'{"next": null, "results": [{"key": "fakeX-2"}]}')
+        mock_oauth_client.return_value.post.side_effect = [first_page, second_page]
+
+        client = DiscoveryApiClient()
+        results = client.iter_metadata_by_query(CatalogQueryFactory())
+
+        self.assertEqual(next(results), {'key': 'fakeX-1'})
+        mock_oauth_client.return_value.post.assert_called_once()
+        self.assertEqual(list(results), [{'key': 'fakeX-2'}])
+        assert mock_oauth_client.return_value.post.call_count == 2
+
+    # a backoff factor of 0 means we wont wait between retries
+    @override_settings(ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_FACTOR=0, ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_JITTER=0)
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_metadata_by_query_with_growing_count(self, mock_oauth_client):
+        """
+        get_metadata_by_query should keep following next links past the pages counted from the first page,
+        so that content added during the traversal isn't dropped.
+        """
+        def mock_post(*args, **kwargs):
+            page = kwargs['params'].get('page', 1)
+            return mock.Mock(status_code=200, content=json.dumps({
+                'count': 250 if page == 1 else 350,
+                'next': 'next-page' if page < 4 else None,
+                'results': [{'key': f'fakeX-{page}'}],
+            }).encode())
+        mock_oauth_client.return_value.post.side_effect = mock_post
+
+        client = DiscoveryApiClient()
+        actual_response = client.get_metadata_by_query(CatalogQueryFactory())
+
+        assert mock_oauth_client.return_value.post.call_count == 4
+        expected_response = [{'key': f'fakeX-{page}'} for page in range(1, 5)]
+        self.assertEqual(actual_response, expected_response)
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_metadata_by_query_with_shrinking_count(self, mock_oauth_client):
+        """
+        get_metadata_by_query should treat a page counted from the first page that no longer exists
+        as the end of the results, rather than failing the whole query.
+        """
+        def mock_post(*args, **kwargs):
+            page = kwargs['params'].get('page', 1)
+            if page == 3:
+                return mock.Mock(status_code=404, content=b'{"detail": "Invalid page."}')
+            return mock.Mock(status_code=200, content=json.dumps({
+                'count': 250 if page == 1 else 150,
+                # the last remaining page still links to the page that was just removed
+                'next': 'next-page',
+                'results': [{'key': f'fakeX-{page}'}],
+            }).encode())
+        mock_oauth_client.return_value.post.side_effect = mock_post
+
+        client = DiscoveryApiClient()
+        actual_response = client.get_metadata_by_query(CatalogQueryFactory())
+
+        assert mock_oauth_client.return_value.post.call_count == 3
+        self.assertEqual(actual_response, [{'key': 'fakeX-1'}, {'key': 'fakeX-2'}])
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_metadata_by_query_logs_failed_page(self, mock_oauth_client):
+        """
+        get_metadata_by_query should report the page that failed when pages are fetched concurrently.
+        """
+        def mock_post(*args, **kwargs):
+            page = kwargs['params'].get('page', 1)
+            if page == 3:
+                return mock.Mock(status_code=400, content=b'{}')
+            return mock.Mock(status_code=200, content=json.dumps({
+                'count': 450,
+                'next': 'next-page',
+                'results': [{'key': f'fakeX-{page}'}],
+            }).encode())
+        mock_oauth_client.return_value.post.side_effect = mock_post
+
+        client = DiscoveryApiClient()
+        with self.assertLogs('enterprise_catalog.apps.api_client.discovery', level='ERROR') as logs:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.get_metadata_by_query(CatalogQueryFactory())
+
+        self.assertIn('(page 3)', logs.output[-1])
+
+    @override_settings(ENTERPRISE_DISCOVERY_CLIENT_MAX_WORKERS=2)
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_retrieve_pages_concurrently_bounds_read_ahead(self, mock_oauth_client):  # pylint: disable=unused-argument
+        """
+        Only MAX_WORKERS pages should be fetched ahead of the page being consumed.
+        """
+        retrieved_pages = []
+
+        def retrieve_page(page, _stop_event):
+            retrieved_pages.append(page)
+            return page
+
+        client = DiscoveryApiClient()
+        futures = client._retrieve_pages_concurrently(retrieve_page, range(2, 10))  # pylint: disable=protected-access
+        with closing(futures):
+            page, future = next(futures)
+            self.assertEqual((page, future.result()), (2, 2))
+        self.assertLessEqual(set(retrieved_pages), {2, 3, 4})
+
+        futures = client._retrieve_pages_concurrently(retrieve_page, range(2, 10))  # pylint: disable=protected-access
+        self.assertEqual([future.result() for _, future in futures], list(range(2, 10)))
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_retrieve_metadata_for_content_filter_stops_retrying(self, mock_oauth_client):
+        """
+        A page fetched in the background should give up rather than retry once its caller has stopped waiting.
+        """
+        mock_oauth_client.return_value.post.return_value = mock.Mock(status_code=503, content=b'{}')
+        stop_event = threading.Event()
+        stop_event.set()
+
+        client = DiscoveryApiClient()
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client._retrieve_metadata_for_content_filter(  # pylint: disable=protected-access
+                {}, 2, {'page': 2}, stop_event,
+            )
+        mock_oauth_client.return_value.post.assert_called_once()
+
     @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
     def test_get_metadata_by_query_with_retry_and_error(self, mock_oauth_client):
         """
@@ -40,18 +252,39 @@ class TestDiscoveryApiClient(TestCase):
         traverse_pagination if traverse_pagination is false.
         """
 
-        mock_oauth_client.return_value.post.return_value.status_code = 400
-        mock_oauth_client.return_value.post.return_value.json.return_value = {}
+        mock_oauth_client.return_value.post.return_value.status_code = 503
+        mock_oauth_client.return_value.post.return_value.content = b'{}'
 
         catalog_query = CatalogQueryFactory()
         client = DiscoveryApiClient()
-        # setting this to 0 means we wont wait between retries
-        client.BACKOFF_FACTOR = 0
 
-        client.get_metadata_by_query(catalog_query)
+        with mock.patch('enterprise_catalog.apps.api_client.discovery.time.sleep') as mock_sleep:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.get_metadata_by_query(catalog_query)
         # the retry logic will end up calling this 5 times
         assert mock_oauth_client.return_value.post.call_count == 5
+        # but won't back-off again after the final attempt
+        assert mock_sleep.call_count == 4
 
+    @ddt.data(400, 401, 403, 404)
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_metadata_by_query_with_unretryable_error(self, status_code, mock_oauth_client):
+        """
+        get_metadata_by_query should raise without retrying when discovery responds with an unretryable error.
+        """
+        mock_oauth_client.return_value.post.return_value.status_code = status_code
+
+        catalog_query = CatalogQueryFactory()
+        client = DiscoveryApiClient()
+
+        with mock.patch('enterprise_catalog.apps.api_client.discovery.time.sleep') as mock_sleep:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                client.get_metadata_by_query(catalog_query)
+        mock_oauth_client.return_value.post.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    # a backoff factor of 0 means we wont wait between retries
+    @override_settings(ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_FACTOR=0, ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_JITTER=0)
     @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
     def test_get_metadata_by_query_with_retry_and_exception(self, mock_oauth_client):
         """
@@ -63,12 +296,71 @@ class TestDiscoveryApiClient(TestCase):
 
         catalog_query = CatalogQueryFactory()
         client = DiscoveryApiClient()
-        # setting this to 0 means we wont wait between retries
-        client.BACKOFF_FACTOR = 0
 
         with self.assertRaises(requests.exceptions.ChunkedEncodingError):
             client.get_metadata_by_query(catalog_query)
 
+    @override_settings(
+        ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_FACTOR=2,
+        ENTERPRISE_DISCOVERY_CLIENT_MAX_BACKOFF=60,
+        ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_JITTER=0.5,
+    )
+    @mock.patch('enterprise_catalog.apps.api_client.discovery.random.uniform')
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_calculate_backoff_with_jitter(self, mock_oauth_client, mock_uniform):  # pylint: disable=unused-argument
+        """
+        _calculate_backoff should double the backoff every attempt, capped at MAX_BACKOFF_SECONDS,
+        with jitter applied within the cap.
+        """
+        mock_uniform.return_value = 0.5
+
+        client = DiscoveryApiClient()
+
+        assert client._calculate_backoff(1) == 1  # pylint: disable=protected-access
+        assert client._calculate_backoff(3) == 4  # pylint: disable=protected-access
+        assert client._calculate_backoff(5) == 16  # pylint: disable=protected-access
+        assert client._calculate_backoff(6) == 30  # pylint: disable=protected-access
+        assert client._calculate_backoff(100) == 30  # pylint: disable=protected-access
+        mock_uniform.assert_called_with(0.5, 1)
+
+    @override_settings(
+        ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_FACTOR=2,
+        ENTERPRISE_DISCOVERY_CLIENT_MAX_BACKOFF=60,
+        ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_JITTER=0.5,
+    )
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_calculate_backoff_keeps_jitter_once_capped(self, mock_oauth_client):  # pylint: disable=unused-argument
+        """
+        _calculate_backoff should keep spreading out retries once the backoff reaches MAX_BACKOFF_SECONDS.
+        """
+        client = DiscoveryApiClient()
+
+        calculate_backoff = client._calculate_backoff  # pylint: disable=protected-access
+        backoffs = {calculate_backoff(attempt) for attempt in range(6, 10) for _ in range(10)}
+
+        assert all(30 <= backoff <= 60 for backoff in backoffs)
+        assert len(backoffs) > 1
+
+    @override_settings(ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_FACTOR=0, ENTERPRISE_DISCOVERY_CLIENT_BACKOFF_JITTER=0)
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_metadata_by_query_with_retry_and_invalid_json(self, mock_oauth_client):
+        """
+        get_metadata_by_query should retry when a successful response's body can't be decoded,
+        without decoding the invalid body a second time through response.json().
+        """
+        invalid_response = mock.Mock(status_code=200, content=b'{"results": [')
+        valid_response = mock.Mock(status_code=200, content=b'{"results": [{"key": "fakeX"}]}')
+        mock_oauth_client.return_value.post.side_effect = [invalid_response, valid_response]
+
+        catalog_query = CatalogQueryFactory()
+        client = DiscoveryApiClient()
+        actual_response = client.get_metadata_by_query(catalog_query)
+
+        assert mock_oauth_client.return_value.post.call_count == 2
+        self.assertEqual(actual_response, [{'key': 'fakeX'}])
+        invalid_response.json.assert_not_called()
+        valid_response.json.assert_not_called()
+
     @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
     def test_get_metadata_by_query_with_error(self, mock_oauth_client):
         """
@@ -88,9 +380,8 @@ class TestDiscoveryApiClient(TestCase):
         """
         get_courses should call discovery endpoint to fetch all courses
         """
-        mock_oauth_client.return_value.get.return_value.json.return_value = {
-            'results': [{'key': 'fakeX'}],
-        }
+        mock_oauth_client.return_value.get.return_value.headers = {}
+        mock_oauth_client.return_value.get.return_value.content = b'{"results": [{"key": "fakeX"}]}'
 
         query_params = {'ordering': 'key'}
         client = DiscoveryApiClient()
@@ -116,3 +407,154 @@ class TestDiscoveryApiClient(TestCase):
 
         expected_response = []
         self.assertEqual(actual_response, expected_response)
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_courses_with_multiple_pages(self, mock_oauth_client):
+        """
+        get_courses should fetch the remaining offsets based on the total count,
+        and return the results in offset order.
+        """
+        def mock_get(*args, **kwargs):
+            offset = kwargs['params'].get('offset', 0)
+            return mock.Mock(headers={}, content=json.dumps({
+                'count': 2 * DISCOVERY_OFFSET_SIZE + 1,
+                'next': 'next-page' if offset < 2 * DISCOVERY_OFFSET_SIZE else None,
+                'results': [{'key': f'fakeX-{offset}'}],
+            }).encode())
+        mock_oauth_client.return_value.get.side_effect = mock_get
+
+        client = DiscoveryApiClient()
+        actual_response = client.get_courses({'ordering': 'key'})
+
+        assert mock_oauth_client.return_value.get.call_count == 3
+        expected_response = [
+            {'key': 'fakeX-0'},
+            {'key': f'fakeX-{DISCOVERY_OFFSET_SIZE}'},
+            {'key': f'fakeX-{2 * DISCOVERY_OFFSET_SIZE}'},
+        ]
+        self.assertEqual(actual_response, expected_response)
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_courses_with_growing_count(self, mock_oauth_client):
+        """
+        get_courses should keep following next links past the offsets counted from the first page,
+        so that courses added during the traversal aren't dropped.
+        """
+        def mock_get(*args, **kwargs):
+            offset = kwargs['params'].get('offset', 0)
+            return mock.Mock(status_code=200, headers={}, content=json.dumps({
+                'count': DISCOVERY_OFFSET_SIZE + 1 if offset == 0 else 2 * DISCOVERY_OFFSET_SIZE + 1,
+                'next': 'next-page' if offset < 2 * DISCOVERY_OFFSET_SIZE else None,
+                'results': [{'key': f'fakeX-{offset}'}],
+            }).encode())
+        mock_oauth_client.return_value.get.side_effect = mock_get
+
+        client = DiscoveryApiClient()
+        actual_response = client.get_courses({'ordering': 'key'})
+
+        assert mock_oauth_client.return_value.get.call_count == 3
+        expected_response = [{'key': f'fakeX-{offset * DISCOVERY_OFFSET_SIZE}'} for offset in range(3)]
+        self.assertEqual(actual_response, expected_response)
+
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_courses_revalidates_cached_response(self, mock_oauth_client):
+        """
+        get_courses should send the validators of a previous response, and reuse its data on a 304.
+        """
+        cache.clear()
+        first_response = mock.Mock(
+            status_code=200,
+            headers={'ETag': '"abc"'},
+            content=b'{"results": [{"key": "fakeX"}]}',
+        )
+        not_modified_response = mock.Mock(status_code=304, headers={'ETag': '"abc"'})
+        mock_oauth_client.return_value.get.side_effect = [first_response, not_modified_response]
+
+        query_params = {'keys': 'fakeX'}
+        client = DiscoveryApiClient()
+        self.assertEqual(client.get_courses(query_params), [{'key': 'fakeX'}])
+        self.assertEqual(client.get_courses(query_params), [{'key': 'fakeX'}])
+
+        first_call, second_call = mock_oauth_client.return_value.get.call_args_list
+        self.assertEqual(first_call.kwargs['headers'], {})
+        self.assertEqual(second_call.kwargs['headers'], {'If-None-Match': '"abc"'})
+        not_modified_response.json.assert_not_called()
+
+    @mock.patch('enterprise_catalog.apps.api_client.discovery.cache.set')
+    @mock.patch('enterprise_catalog.apps.api_client.base_oauth.OAuthAPIClient')
+    def test_get_courses_when_cache_set_fails(self, mock_oauth_client, mock_cache_set):
+        """
+        get_courses should keep a successfully retrieved page even when it can't be cached.
+        """
+        cache.clear()
+        mock_oauth_client.return_value.get.return_value = mock.Mock(
+            status_code=200,
+            headers={'ETag': '"abc"'},
+            content=b'{"results": [{"key": "fakeX"}]}',
+        )
+        mock_cache_set.side_effect = Exception('SERVER_ERROR object too large for cache')
+
+        client = DiscoveryApiClient()
+        self.assertEqual(client.get_courses({'keys': 'fakeX'}), [{'key': 'fakeX'}])
+        mock_cache_set.assert_called_once()
+
+
+class TestCatalogQueryMetadata(TestCase):
+    """ CatalogQueryMetadata tests. """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Don't let a DiscoveryApiClient shared by an earlier test bypass the mocked client class
+        shared_client_patcher = mock.patch('enterprise_catalog.apps.api_client.discovery._CLIENT', None)
+        shared_client_patcher.start()
+        self.addCleanup(shared_client_patcher.stop)
+
+    @mock.patch('enterprise_catalog.apps.api_client.discovery.DiscoveryApiClient')
+    def test_metadata_is_cached_by_content_filter(self, mock_client):
+        """
+        Catalog queries sharing a content filter should only call discovery once, until the cache is cleared.
+        """
+        mock_client.return_value.get_metadata_by_query.return_value = [{'key': 'fakeX'}]
+        catalog_query = CatalogQueryFactory()
+        other_catalog_query = CatalogQueryFactory(
+            content_filter=catalog_query.content_filter,
+            include_exec_ed_2u_courses=not catalog_query.include_exec_ed_2u_courses,
+        )
+
+        self.assertEqual(CatalogQueryMetadata(catalog_query).metadata, [{'key': 'fakeX'}])
+        self.assertEqual(CatalogQueryMetadata(other_catalog_query).metadata, [{'key': 'fakeX'}])
+        mock_client.return_value.get_metadata_by_query.assert_called_once_with(catalog_query)
+
+        clear_catalog_query_metadata_cache(other_catalog_query)
+        CatalogQueryMetadata(other_catalog_query)
+        assert mock_client.return_value.get_metadata_by_query.call_count == 2
+
+    @mock.patch('enterprise_catalog.apps.api_client.discovery.cache.set')
+    @mock.patch('enterprise_catalog.apps.api_client.discovery.DiscoveryApiClient')
+    def test_metadata_when_cache_set_fails(self, mock_client, mock_cache_set):
+        """
+        CatalogQueryMetadata should still return the retrieved metadata when it can't be cached,
+        e.g. because it's too large for memcached.
+        """
+        mock_client.return_value.get_metadata_by_query.return_value = [{'key': 'fakeX'}]
+        mock_cache_set.side_effect = Exception('SERVER_ERROR object too large for cache')
+
+        with self.assertLogs('enterprise_catalog.apps.api_client.discovery', level='WARNING'):
+            metadata = CatalogQueryMetadata(CatalogQueryFactory()).metadata
+
+        self.assertEqual(metadata, [{'key': 'fakeX'}])
+        mock_cache_set.assert_called_once()
+
+    @mock.patch('enterprise_catalog.apps.api_client.discovery.DiscoveryApiClient')
+    def test_discovery_client_is_shared(self, mock_client):
+        """
+        CatalogQueryMetadata lookups should share a single DiscoveryApiClient.
+        """
+        mock_client.return_value.get_metadata_by_query.return_value = []
+
+        CatalogQueryMetadata(CatalogQueryFactory())
+        CatalogQueryMetadata(CatalogQueryFactory())
+
+        mock_client.assert_called_once()
+        assert mock_client.return_value.get_metadata_by_query.call_count == 2
@@ -101,13 +101,20 @@ class UpdateContentMetadataCommandTests(TestCase):
     @mock.patch('enterprise_catalog.apps.catalog.management.commands.update_content_metadata.group')
     @mock.patch('enterprise_catalog.apps.catalog.management.commands.update_content_metadata.update_catalog_metadata_task')
     @mock.patch('enterprise_catalog.apps.catalog.management.commands.update_content_metadata.update_full_content_metadata_task')
+    @mock.patch(
+        'enterprise_catalog.apps.catalog.management.commands.update_content_metadata.clear_catalog_query_metadata_cache')
     def test_force_update_content_metadata(
-        self, mock_full_metadata_task, mock_catalog_task, mock_group, mock_fetch_missing_pathway, mock_fetch_missing_course
+        self, mock_clear_cache, mock_full_metadata_task, mock_catalog_task, mock_group, mock_fetch_missing_pathway,
+        mock_fetch_missing_course
     ):
         """
-        Verify that the job creates an update task for every catalog query
+        Verify that the job creates an update task for every catalog query, clearing any cached discovery results
         """
         call_command(self.command_name, force=True)
+        mock_clear_cache.assert_has_calls(
+            [mock.call(self.catalog_query_a), mock.call(self.catalog_query_b)],
+            any_order=True,
+        )
         assert mock_fetch_missing_pathway.si.call_args._get_call_arguments()[1] == {"force": True}
         mock_group.assert_called_once_with([
             mock_catalog_task.s(catalog_query_id=self.catalog_query_a, force=True),
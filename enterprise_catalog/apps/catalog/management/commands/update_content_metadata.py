@@ -9,6 +9,9 @@ from enterprise_catalog.apps.api.tasks import (
     update_catalog_metadata_task,
     update_full_content_metadata_task,
 )
+from enterprise_catalog.apps.api_client.discovery import (
+    clear_catalog_query_metadata_cache,
+)
 from enterprise_catalog.apps.catalog.constants import COURSE, TASK_TIMEOUT
 from enterprise_catalog.apps.catalog.models import (
     CatalogQuery,
@@ -30,6 +33,9 @@ class Command(BaseCommand):
             ' to update content_metadata for catalog query %s.'
         )
         logger.info(message, catalog_query)
+        if force:
+            # Don't let a forced update be served stale /search/all/ results from cache.
+            clear_catalog_query_metadata_cache(catalog_query)
         return update_catalog_metadata_task.s(catalog_query.id, force=force)
 
     def _fetch_missing_course_metadata_task(self, force=False):
@@ -28,6 +28,13 @@ from enterprise_catalog.apps.catalog.tests import factories
 class TestModels(TestCase):
     """ Models tests. """
 
+    def setUp(self):
+        super().setUp()
+        # Don't let a DiscoveryApiClient shared by an earlier test bypass the mocked client class
+        shared_client_patcher = mock.patch('enterprise_catalog.apps.api_client.discovery._CLIENT', None)
+        shared_client_patcher.start()
+        self.addCleanup(shared_client_patcher.stop)
+
     @ddt.data(
         {'content_type': COURSE_RUN, 'course_type': EXEC_ED_2U_COURSE_TYPE, 'expected_value': False},
         {'content_type': PROGRAM, 'course_type': EXEC_ED_2U_COURSE_TYPE, 'expected_value': False},
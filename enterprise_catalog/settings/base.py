@@ -377,7 +377,8 @@ STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
 # How long we keep API Client data in cache. (seconds)
 ONE_HOUR = 60 * 60
 ENTERPRISE_CUSTOMER_CACHE_TIMEOUT = ONE_HOUR
-DISCOVERY_CATALOG_QUERY_CACHE_TIMEOUT = ONE_HOUR
+# Kept short so that catalog refreshes see recent changes in discovery
+DISCOVERY_CATALOG_QUERY_CACHE_TIMEOUT = 5 * 60
 DISCOVERY_COURSE_DATA_CACHE_TIMEOUT = ONE_HOUR
 
 # URLs